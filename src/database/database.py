@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from dotenv import load_dotenv
@@ -11,9 +12,37 @@ class Base(DeclarativeBase):
     pass 
 
 DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+
+# Sync engine/pool used for startup seeding (COPY via psycopg2) and migrations.
+# Only the lifespan session and one connection per seed worker process use it,
+# so the pool stays small. LIFO reuse keeps hot connections warm, pre-ping drops
+# stale ones before use.
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=int(os.getenv("DB_SYNC_POOL_SIZE", "2")),
+    max_overflow=int(os.getenv("DB_SYNC_MAX_OVERFLOW", "2")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_session():
     with SessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+# Async engine/pool (asyncpg) serving the API endpoints on the event loop.
+# No overflow: the pool size is a hard cap on connections the API can open.
+async_engine = create_async_engine(
+    make_url(DATABASE_URL).set(drivername="postgresql+asyncpg"),
+    pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "0")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_async_session():
+    async with AsyncSessionLocal() as session:
+        yield session
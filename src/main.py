@@ -5,15 +5,15 @@ from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import text
 
 # Internal Imports
-from src.database.database import Base
+from src.database.database import Base, engine, SessionLocal, async_engine
 from src.models.merchant_event import MerchantEvent
 # Update this import to match your new function name
-from src.utils.csv_to_psql import seed_data_from_folder
+from src.utils.csv_to_psql import seed_data_from_folder, SEED_LOCK_KEY
 from src.routers.analytic_routes import analytic_router
+from src.services.analytics_service import AnalyticsService, APPROX_DISTINCT
 
 # Load environment variables
 load_dotenv()
@@ -22,11 +22,6 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Database setup
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -37,39 +32,60 @@ async def lifespan(app: FastAPI):
     
     # 1. Ensure tables exist
     Base.metadata.create_all(bind=engine)
+    if APPROX_DISTINCT:
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS hll"))
     
-    # 2. Truncate all existing data
-    db = SessionLocal()
-    try:
-        db.query(MerchantEvent).delete()
-        db.commit()
-        logger.info("Database truncated.")
-    except Exception as e:
-        logger.error(f"Error truncating database: {e}")
-        db.rollback()
-    finally:
-        db.close()
-    
-    # 3. Seed from folder
-    db = SessionLocal()
-    try:
-        # Point to the root directory containing your CSVs
-        data_folder = os.path.join(os.path.dirname(__file__), "../../../data")
-        data_folder_env = os.getenv("DATA_FOLDER_PATH", "./data")
-        data_folder = data_folder_env if os.path.exists(data_folder_env) else data_folder
+    # Instances reseed one at a time. The session-level advisory lock lives on its own
+    # connection so it is held across truncate, seed and view refresh (commits included).
+    with engine.connect() as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SEED_LOCK_KEY})
+        lock_conn.commit()
+        try:
+            # One session (and one pooled connection) covers truncate, seed and view refresh
+            with SessionLocal() as db:
+                # 2. Truncate all existing data
+                try:
+                    # TRUNCATE frees the table in one step instead of a WAL record per deleted row
+                    db.execute(text(f"TRUNCATE TABLE {MerchantEvent.__tablename__} RESTART IDENTITY"))
+                    db.commit()
+                    logger.info("Database truncated.")
+                except Exception as e:
+                    logger.error(f"Error truncating database: {e}")
+                    db.rollback()
         
-        if os.path.exists(data_folder):
-            seed_data_from_folder(db, data_folder)
-            logger.info("Startup seeding process completed.")
-        else:
-            logger.warning(f"Data folder not found at: {data_folder}")
-    except Exception as e:
-        logger.error(f"Error during startup seeding: {e}")
-    finally:
-        db.close()
+                # 3. Seed from folder
+                try:
+                    # Point to the root directory containing your CSVs
+                    data_folder = os.path.join(os.path.dirname(__file__), "../../../data")
+                    data_folder_env = os.getenv("DATA_FOLDER_PATH", "./data")
+                    data_folder = data_folder_env if os.path.exists(data_folder_env) else data_folder
+            
+                    if os.path.exists(data_folder):
+                        seed_data_from_folder(db, data_folder)
+                        logger.info("Startup seeding process completed.")
+                    else:
+                        logger.warning(f"Data folder not found at: {data_folder}")
+                except Exception as e:
+                    logger.error(f"Error during startup seeding: {e}")
+                    db.rollback()
+
+                # 4. Precompute the analytics aggregates from the seeded data
+                try:
+                    AnalyticsService.refresh_materialized_views(db)
+                    logger.info("Analytics materialized views refreshed.")
+                except Exception as e:
+                    logger.error(f"Error refreshing materialized views: {e}")
+                    db.rollback()
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SEED_LOCK_KEY})
+
+    # 5. Drop analytics results cached before the reseed
+    AnalyticsService.clear_cache()
 
     yield 
     logger.info("Shutting down...")
+    await async_engine.dispose()
 
 # Initialize FastAPI with lifespan
 app = FastAPI(
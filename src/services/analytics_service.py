@@ -1,166 +1,257 @@
-from sqlalchemy import func, case, and_, extract
+from sqlalchemy import func, and_, extract, cast, Float, Integer, select, table, column
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from src.models.merchant_event import MerchantEvent
 from decimal import Decimal
+from functools import wraps
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# In-process cache of analytics results: method name -> (expires_at, result).
+# Data only changes while seeding, so results can be reused between requests.
+CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+_cache: dict = {}
+
+# Estimate distinct merchant counts with HyperLogLog (needs the postgresql-hll extension)
+APPROX_DISTINCT = os.getenv("ANALYTICS_APPROX_DISTINCT", "False").lower() == "true"
+
+KYC_STAGES = ["STARTER", "VERIFIED", "PREMIUM"]
+
+
+def _ttl_cached(fallback):
+    """
+    Caches the result of an analytics method for CACHE_TTL_SECONDS (the session is not part of the key).
+    If the query fails the error is logged and fallback() is returned without being cached.
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(db: AsyncSession):
+            entry = _cache.get(func.__name__)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            try:
+                result = await func(db)
+            except Exception as e:
+                logger.error(f"Error in {func.__name__}: {e}")
+                return fallback()
+            _cache[func.__name__] = (time.monotonic() + CACHE_TTL_SECONDS, result)
+            return result
+        return wrapper
+    return decorator
+
+
+def _count_distinct_merchants(*criteria):
+    """
+    COUNT(DISTINCT merchant_id), optionally restricted with FILTER (WHERE ...).
+    Uses an approximate HyperLogLog cardinality when APPROX_DISTINCT is enabled.
+    """
+    if APPROX_DISTINCT:
+        sketch = func.hll_add_agg(func.hll_hash_text(MerchantEvent.merchant_id))
+        return func.hll_cardinality(sketch.filter(*criteria) if criteria else sketch)
+    count = func.count(func.distinct(MerchantEvent.merchant_id))
+    return count.filter(*criteria) if criteria else count
+
+
+def _materialized_view(name: str, query):
+    """Lightweight table construct for a materialized view built from query."""
+    return table(name, *(column(col.key) for col in query.selected_columns))
+
+
+# Aggregate queries over merchant_events, precomputed into materialized views after seeding
+
+# Summed as double precision: float8 addition is much cheaper than NUMERIC
+# and the result is rounded to 2 decimal places anyway
+_total_volume = func.sum(cast(MerchantEvent.amount, Float)).label("total_volume")
+TOP_MERCHANT_QUERY = select(
+    MerchantEvent.merchant_id,
+    _total_volume
+).where(
+    MerchantEvent.status == "SUCCESS",
+    MerchantEvent.merchant_id.isnot(None),
+    MerchantEvent.amount.isnot(None)
+).group_by(
+    MerchantEvent.merchant_id
+).order_by(
+    _total_volume.desc()
+).limit(1)
+
+# Month as a compact integer key (year * 12 + month) rather than a timestamp or text
+_year_month = cast(
+    extract('year', MerchantEvent.event_timestamp) * 12
+    + extract('month', MerchantEvent.event_timestamp),
+    Integer
+).label("year_month")
+MONTHLY_ACTIVE_MERCHANTS_QUERY = select(
+    _year_month,
+    _count_distinct_merchants().label("merchant_count")
+).where(
+    MerchantEvent.status == "SUCCESS",
+    MerchantEvent.merchant_id.isnot(None),
+    MerchantEvent.event_timestamp.isnot(None)
+).group_by(
+    _year_month
+)
+
+PRODUCT_ADOPTION_QUERY = select(
+    MerchantEvent.product,
+    _count_distinct_merchants().label("merchant_count")
+).where(
+    MerchantEvent.product.isnot(None),
+    MerchantEvent.merchant_id.isnot(None)
+).group_by(
+    MerchantEvent.product
+)
+
+# One pass over successful events, one filtered count per stage
+KYC_FUNNEL_QUERY = select(*[
+    _count_distinct_merchants(
+        MerchantEvent.merchant_tier == stage
+    ).label(stage.lower())
+    for stage in KYC_STAGES
+]).where(
+    MerchantEvent.merchant_tier.in_(KYC_STAGES),
+    MerchantEvent.status == "SUCCESS",
+    MerchantEvent.merchant_id.isnot(None)
+)
+
+# Failure percentage computed in SQL: FAILED / (SUCCESS + FAILED) x 100
+FAILURE_RATES_QUERY = select(
+    MerchantEvent.product,
+    (
+        func.count().filter(MerchantEvent.status == "FAILED") * 100.0
+        / func.nullif(func.count(), 0)
+    ).label("failure_rate")
+).where(
+    MerchantEvent.product.isnot(None),
+    MerchantEvent.status.in_(["SUCCESS", "FAILED"])
+).group_by(
+    MerchantEvent.product
+)
+
+MV_TOP_MERCHANT = _materialized_view("mv_top_merchant", TOP_MERCHANT_QUERY)
+MV_MONTHLY_ACTIVE_MERCHANTS = _materialized_view("mv_monthly_active_merchants", MONTHLY_ACTIVE_MERCHANTS_QUERY)
+MV_PRODUCT_ADOPTION = _materialized_view("mv_product_adoption", PRODUCT_ADOPTION_QUERY)
+MV_KYC_FUNNEL = _materialized_view("mv_kyc_funnel", KYC_FUNNEL_QUERY)
+MV_FAILURE_RATES = _materialized_view("mv_failure_rates", FAILURE_RATES_QUERY)
+
+MATERIALIZED_VIEWS = [
+    (MV_TOP_MERCHANT, TOP_MERCHANT_QUERY),
+    (MV_MONTHLY_ACTIVE_MERCHANTS, MONTHLY_ACTIVE_MERCHANTS_QUERY),
+    (MV_PRODUCT_ADOPTION, PRODUCT_ADOPTION_QUERY),
+    (MV_KYC_FUNNEL, KYC_FUNNEL_QUERY),
+    (MV_FAILURE_RATES, FAILURE_RATES_QUERY),
+]
+
 
 class AnalyticsService:
     """Service for analytics queries and computations."""
     
     @staticmethod
-    def get_top_merchant(db: Session) -> dict:
+    def clear_cache() -> None:
+        """Drops all cached analytics results (call after the data changes)."""
+        _cache.clear()
+    
+    @staticmethod
+    def refresh_materialized_views(db: Session) -> None:
+        """
+        (Re)creates the materialized views backing the analytics endpoints.
+        Views are dropped and rebuilt so definition changes are always picked up.
+        """
+        connection = db.connection()
+        for view, query in MATERIALIZED_VIEWS:
+            definition = query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+            connection.exec_driver_sql(f"DROP MATERIALIZED VIEW IF EXISTS {view.name}")
+            connection.exec_driver_sql(f"CREATE MATERIALIZED VIEW {view.name} AS {definition}")
+        db.commit()
+    
+    @staticmethod
+    @_ttl_cached(lambda: {"merchant_id": None, "total_volume": 0.0})
+    async def get_top_merchant(db: AsyncSession) -> dict:
         """
         Returns the merchant with the highest total successful transaction amount.
         Monetary values formatted to 2 decimal places.
         """
-        try:
-            result = db.query(
-                MerchantEvent.merchant_id,
-                func.sum(MerchantEvent.amount).label("total_volume")
-            ).filter(
-                MerchantEvent.status == "SUCCESS",
-                MerchantEvent.merchant_id.isnot(None),
-                MerchantEvent.amount.isnot(None)
-            ).group_by(
-                MerchantEvent.merchant_id
-            ).order_by(
-                func.sum(MerchantEvent.amount).desc()
-            ).first()
-            
-            if not result:
-                return {"merchant_id": None, "total_volume": 0.0}
-            
-            total_volume = 0.0
-            if result.total_volume:
-                try:
-                    total_volume = round(float(result.total_volume), 2)
-                except (ValueError, TypeError):
-                    logger.warning(f"Could not convert total_volume to float: {result.total_volume}")
-                    total_volume = 0.0
-            
-            return {
-                "merchant_id": result.merchant_id,
-                "total_volume": total_volume
-            }
-        except Exception as e:
-            logger.error(f"Error in get_top_merchant: {e}")
+        result = (await db.execute(select(MV_TOP_MERCHANT))).first()
+        
+        if not result:
             return {"merchant_id": None, "total_volume": 0.0}
+        
+        total_volume = 0.0
+        if result.total_volume:
+            try:
+                total_volume = round(float(result.total_volume), 2)
+            except (ValueError, TypeError):
+                logger.warning(f"Could not convert total_volume to float: {result.total_volume}")
+                total_volume = 0.0
+        
+        return {
+            "merchant_id": result.merchant_id,
+            "total_volume": total_volume
+        }
     
     @staticmethod
-    def get_monthly_active_merchants(db: Session) -> dict:
+    @_ttl_cached(dict)
+    async def get_monthly_active_merchants(db: AsyncSession) -> dict:
         """
         Returns count of unique merchants with at least one successful event per month.
         """
-        try:
-            results = db.query(
-                func.to_char(MerchantEvent.event_timestamp, 'YYYY-MM').label("month"),
-                func.count(func.distinct(MerchantEvent.merchant_id)).label("merchant_count")
-            ).filter(
-                MerchantEvent.status == "SUCCESS",
-                MerchantEvent.merchant_id.isnot(None),
-                MerchantEvent.event_timestamp.isnot(None)
-            ).group_by(
-                func.to_char(MerchantEvent.event_timestamp, 'YYYY-MM')
-            ).order_by(
-                func.to_char(MerchantEvent.event_timestamp, 'YYYY-MM')
-            ).all()
-            
-            return {row.month: (row.merchant_count or 0) for row in results if row.month}
-        except Exception as e:
-            logger.error(f"Error in get_monthly_active_merchants: {e}")
-            return {}
+        results = (await db.execute(
+            select(MV_MONTHLY_ACTIVE_MERCHANTS).order_by(MV_MONTHLY_ACTIVE_MERCHANTS.c.year_month)
+        )).all()
+        
+        monthly_active_merchants = {}
+        for row in results:
+            if row.year_month is None:
+                continue
+            # Format the month keys in Python on the small result set
+            year, month = divmod(row.year_month - 1, 12)
+            monthly_active_merchants[f"{year}-{month + 1:02d}"] = int(round(row.merchant_count or 0))
+        
+        return monthly_active_merchants
     
     @staticmethod
-    def get_product_adoption(db: Session) -> dict:
+    @_ttl_cached(dict)
+    async def get_product_adoption(db: AsyncSession) -> dict:
         """
         Returns unique merchant count per product, sorted by count descending.
         """
-        try:
-            results = db.query(
-                MerchantEvent.product,
-                func.count(func.distinct(MerchantEvent.merchant_id)).label("merchant_count")
-            ).filter(
-                MerchantEvent.product.isnot(None),
-                MerchantEvent.merchant_id.isnot(None)
-            ).group_by(
-                MerchantEvent.product
-            ).order_by(
-                func.count(func.distinct(MerchantEvent.merchant_id)).desc()
-            ).all()
-            
-            return {row.product: (row.merchant_count or 0) for row in results if row.product}
-        except Exception as e:
-            logger.error(f"Error in get_product_adoption: {e}")
-            return {}
+        results = (await db.execute(
+            select(MV_PRODUCT_ADOPTION).order_by(MV_PRODUCT_ADOPTION.c.merchant_count.desc())
+        )).all()
+        
+        return {row.product: int(round(row.merchant_count or 0)) for row in results if row.product}
     
     @staticmethod
-    def get_kyc_funnel(db: Session) -> dict:
+    @_ttl_cached(lambda: {"tier_starter": 0, "tier_verified": 0, "tier_premium": 0})
+    async def get_kyc_funnel(db: AsyncSession) -> dict:
         """
         Returns KYC conversion funnel (unique merchants at each stage, successful events only).
         """
-        try:
-            stages = ["STARTER", "VERIFIED", "PREMIUM"]
-            result = {}
-            
-            for stage in stages:
-                count = db.query(
-                    func.count(func.distinct(MerchantEvent.merchant_id))
-                ).filter(
-                    MerchantEvent.merchant_tier == stage,
-                    MerchantEvent.status == "SUCCESS",
-                    MerchantEvent.merchant_id.isnot(None)
-                ).scalar()
-                
-                result[f"tier_{stage.lower()}"] = count or 0
-            
-            return result
-        except Exception as e:
-            logger.error(f"Error in get_kyc_funnel: {e}")
-            return {"tier_starter": 0, "tier_verified": 0, "tier_premium": 0}
+        counts = (await db.execute(select(MV_KYC_FUNNEL))).one()
+        
+        result = {
+            f"tier_{stage.lower()}": int(round(getattr(counts, stage.lower()) or 0))
+            for stage in KYC_STAGES
+        }
+        
+        return result
     
     @staticmethod
-    def get_failure_rates(db: Session) -> list:
+    @_ttl_cached(list)
+    async def get_failure_rates(db: AsyncSession) -> list:
         """
         Returns failure rate per product: (FAILED / (SUCCESS + FAILED)) x 100.
         Excludes PENDING events. Sorted by rate descending.
         Percentages formatted to 1 decimal place.
         """
-        try:
-            results = db.query(
-                MerchantEvent.product,
-                func.count(case((MerchantEvent.status == "FAILED", 1))).label("failed_count"),
-                func.count(case((MerchantEvent.status == "SUCCESS", 1))).label("success_count")
-            ).filter(
-                MerchantEvent.product.isnot(None),
-                MerchantEvent.status.in_(["SUCCESS", "FAILED"])
-            ).group_by(
-                MerchantEvent.product
-            ).all()
-            
-            failure_rates = []
-            for row in results:
-                try:
-                    failed_count = int(row.failed_count) if row.failed_count else 0
-                    success_count = int(row.success_count) if row.success_count else 0
-                    total = failed_count + success_count
-                    
-                    if total > 0:
-                        rate = (failed_count / total) * 100
-                        failure_rates.append({
-                            "product": row.product or "UNKNOWN",
-                            "failure_rate": round(rate, 1)
-                        })
-                except (ValueError, TypeError, ZeroDivisionError) as e:
-                    logger.warning(f"Could not calculate failure rate for product {row.product}: {e}")
-                    continue
-            
-            # Sort by failure_rate descending
-            failure_rates.sort(key=lambda x: x["failure_rate"], reverse=True)
-            
-            return failure_rates
-        except Exception as e:
-            logger.error(f"Error in get_failure_rates: {e}")
-            return []
+        results = (await db.execute(
+            select(MV_FAILURE_RATES).order_by(MV_FAILURE_RATES.c.failure_rate.desc().nulls_last())
+        )).all()
+        
+        return [
+            {"product": row.product, "failure_rate": round(float(row.failure_rate), 1)}
+            for row in results if row.failure_rate is not None
+        ]
@@ -1,57 +1,148 @@
 import csv
+import io
 import os
+import re
 import glob
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
-from sqlalchemy import insert
+from typing import Optional, Tuple
+from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 # Internal Imports
+from src.database.database import SessionLocal, engine
 from src.models.merchant_event import MerchantEvent  
-from src.schemas.merchant_event import MerchantEventCreate 
 
-def _convert_to_iso8601(timestamp_str: str) -> str:
+# Number of files seeded in parallel (one worker process per file)
+SEED_WORKERS = int(os.getenv("SEED_WORKERS", str(os.cpu_count() or 1)))
+
+# Advisory lock key so only one app instance truncates and reseeds at a time
+SEED_LOCK_KEY = 42
+
+# Column order of the rows streamed to COPY FROM STDIN
+COPY_COLUMNS = (
+    "event_id", "merchant_id", "event_timestamp", "product", "event_type",
+    "amount", "status", "channel", "region", "merchant_tier",
+)
+STAGING_TABLE = f"{MerchantEvent.__tablename__}_staging"
+
+# Workers COPY each file into its own unlogged staging table in parallel. The parent then
+# merges the staging tables one at a time in sorted file order, so when an event_id appears
+# in several files the earliest file wins (as with the old sequential load) and concurrent
+# merges cannot deadlock on shared ids.
+DROP_STAGING_SQL = "DROP TABLE IF EXISTS {staging}"
+CREATE_STAGING_SQL = (
+    "CREATE UNLOGGED TABLE {staging} "
+    f"(LIKE {MerchantEvent.__tablename__} INCLUDING DEFAULTS)"
+)
+COPY_SQL = (
+    f"COPY {{staging}} ({', '.join(COPY_COLUMNS)}) "
+    "FROM STDIN WITH (FORMAT csv, NULL '')"
+)
+MERGE_STAGING_SQL = (
+    f"INSERT INTO {MerchantEvent.__tablename__} ({', '.join(COPY_COLUMNS)}) "
+    f"SELECT {', '.join(COPY_COLUMNS)} FROM {{staging}} "
+    "ON CONFLICT (event_id) DO NOTHING"
+)
+
+# Allowed values for the enum-like columns (mirrors MerchantEventCreate)
+PRODUCTS = frozenset({"POS", "AIRTIME", "BILLS", "CARD_PAYMENT", "SAVINGS", "MONIEBOOK", "KYC"})
+STATUSES = frozenset({"SUCCESS", "FAILED", "PENDING"})
+CHANNELS = frozenset({"POS", "APP", "USSD", "WEB", "OFFLINE"})
+MERCHANT_TIERS = frozenset({"STARTER", "VERIFIED", "PREMIUM"})
+
+MERCHANT_ID_PATTERN = re.compile(r"^MRC-[A-Z0-9]{6}$")
+
+# Fallback strptime formats for timestamps that are not ISO 8601
+TIMESTAMP_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%d/%m/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+)
+
+# Day-first and month-first formats both match dates like 02/03/2024, so they are
+# never remembered between rows; the list order (day-first) always decides
+AMBIGUOUS_TIMESTAMP_FORMATS = frozenset({"%d/%m/%Y %H:%M:%S", "%m/%d/%Y %H:%M:%S"})
+
+def _convert_to_iso8601(timestamp_str: str, last_format: Optional[str] = None) -> Tuple[str, Optional[str]]:
     """
     Convert timestamp string to ISO 8601 format using datetime.isoformat().
     If empty or cannot parse, returns empty string.
+    Also returns the strptime format that matched (or last_format if none did or the
+    match is ambiguous), which callers pass back in so it is tried first on the next row.
     """
     if not timestamp_str or not timestamp_str.strip():
-        return ""
+        return "", last_format
     
     timestamp_str = timestamp_str.strip()
     
-    # Try parsing common datetime formats
-    formats = [
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d %H:%M:%S.%f",
-        "%Y-%m-%dT%H:%M:%S",
-        "%Y-%m-%dT%H:%M:%S.%f",
-        "%d/%m/%Y %H:%M:%S",
-        "%m/%d/%Y %H:%M:%S",
-        "%Y/%m/%d %H:%M:%S",
-    ]
-    
-    # Try fromisoformat first for ISO 8601 strings
+    # Try fromisoformat first for ISO 8601 strings (C-implemented fast path)
     try:
         dt = datetime.fromisoformat(timestamp_str)
-        return dt.isoformat()
+        return dt.isoformat(), last_format
     except ValueError:
         pass
     
-    # Try other common formats
-    for fmt in formats:
+    # Try the format that matched last time before the other common formats
+    if last_format:
+        try:
+            dt = datetime.strptime(timestamp_str, last_format)
+            return dt.isoformat(), last_format
+        except ValueError:
+            pass
+    
+    for fmt in TIMESTAMP_FORMATS:
+        if fmt == last_format:
+            continue
         try:
             dt = datetime.strptime(timestamp_str, fmt)
-            return dt.isoformat()
+            return dt.isoformat(), last_format if fmt in AMBIGUOUS_TIMESTAMP_FORMATS else fmt
         except ValueError:
             continue
     
     # If all parsing fails, return empty string
-    return "" 
+    return "", last_format
+
+def _parse_literal(value: str, allowed: frozenset, field: str):
+    """
+    Returns None for empty values, the value itself if allowed.
+    Raises ValueError for unknown values so the row is skipped.
+    """
+    if not value or not value.strip():
+        return None
+    if value not in allowed:
+        raise ValueError(f"invalid {field}: {value!r}")
+    return value
+
+def _parse_optional_str(value: str):
+    """Strips the value, converting empty strings to None."""
+    value = value.strip() if value else ""
+    return value or None
+
+def _parse_amount(value: str) -> Decimal:
+    """Parses amount, defaulting to 0.00 if empty, invalid or negative."""
+    if not value or not value.strip():
+        return Decimal("0.00")
+    try:
+        amount = Decimal(value.strip())
+    except InvalidOperation:
+        return Decimal("0.00")
+    if not amount.is_finite() or amount < 0:
+        return Decimal("0.00")
+    return amount
 
 def seed_data_from_folder(db: Session, folder_path: str):
     """
     Scans a folder for all CSV files and seeds them into the database.
+    Files are parsed and staged in parallel worker processes, each with its own session,
+    then merged into the table in sorted file order.
+    Raises RuntimeError listing the files that failed once all files are done.
     """
     # 1. Global Check: If the table already has data, skip the entire folder
     if db.query(MerchantEvent).first():
@@ -68,67 +159,184 @@ def seed_data_from_folder(db: Session, folder_path: str):
 
     print(f"Found {len(csv_files)} files. Starting bulk seed...")
 
-    for file_path in csv_files:
-        print(f"Processing: {os.path.basename(file_path)}...")
-        _process_single_csv(db, file_path)
+    staging_tables = {file_path: f"{STAGING_TABLE}_{i}" for i, file_path in enumerate(csv_files)}
+    staged_rows = {}
+    failed_files = []
+    try:
+        # 3. Fan the files out to worker processes, each filling its own staging table
+        max_workers = max(1, min(SEED_WORKERS, len(csv_files)))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_seed_worker) as executor:
+            futures = {
+                executor.submit(_stage_csv_file, file_path, staging_tables[file_path]): file_path
+                for file_path in csv_files
+            }
+            for future in as_completed(futures):
+                try:
+                    staged_rows[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"Error seeding {os.path.basename(futures[future])}: {e}")
+                    failed_files.append(os.path.basename(futures[future]))
+
+        # 4. Merge the staged files one at a time in sorted order (earliest file wins duplicates)
+        for file_path in csv_files:
+            if file_path in staged_rows:
+                _merge_staged_file(db, file_path, staging_tables[file_path], staged_rows[file_path])
+    finally:
+        db.rollback()
+        for staging in staging_tables.values():
+            db.execute(text(DROP_STAGING_SQL.format(staging=staging)))
+        db.commit()
+
+    if failed_files:
+        raise RuntimeError(f"Failed to seed {len(failed_files)} of {len(csv_files)} files: {', '.join(sorted(failed_files))}")
 
-def _process_single_csv(db: Session, csv_file_path: str):
+def _init_seed_worker():
+    """Drops pooled connections inherited from the parent process."""
+    engine.dispose(close=False)
+
+def _stage_csv_file(csv_file_path: str, staging_table: str) -> int:
+    """
+    Worker entry point: copies one CSV file into its staging table using its own session.
+    Duplicates within the file are skipped in memory; event_ids already in the
+    table (or in earlier files) are left to ON CONFLICT when the staging rows are merged.
+    """
+    print(f"Processing: {os.path.basename(csv_file_path)}...")
+    with SessionLocal() as db:
+        return _process_single_csv(db, csv_file_path, staging_table, set())
+
+def _process_single_csv(db: Session, csv_file_path: str, staging_table: str, existing_ids: set) -> int:
     """
     Internal helper to process a single CSV file.
-    SKIPS rows ONLY if event_id or merchant_id is missing/empty.
+    Cleaned rows are streamed straight into the staging table with COPY FROM STDIN.
+    existing_ids holds the raw bytes of event_ids already seen in this file and is updated in place.
+    Returns the number of rows staged.
+    """
+    with open(csv_file_path, mode="r", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        stream = _CsvCopyStream(_iter_clean_rows(reader, existing_ids, os.path.basename(csv_file_path)))
+
+        # COPY runs on the session's own DBAPI connection so it shares its transaction
+        raw_connection = db.connection().connection
+        with raw_connection.cursor() as cursor:
+            cursor.execute(DROP_STAGING_SQL.format(staging=staging_table))
+            cursor.execute(CREATE_STAGING_SQL.format(staging=staging_table))
+            cursor.copy_expert(COPY_SQL.format(staging=staging_table), stream)
+
+        db.commit()
+        return stream.row_count
+
+def _merge_staged_file(db: Session, csv_file_path: str, staging_table: str, staged: int):
+    """Moves one file's staged rows into the table, skipping event_ids that are already there."""
+    inserted = db.execute(text(MERGE_STAGING_SQL.format(staging=staging_table))).rowcount if staged else 0
+
+    if inserted > 0:
+        db.commit()
+        skipped = staged - inserted
+        if skipped:
+            print(f"Skipped {skipped} rows from {os.path.basename(csv_file_path)}: event_id already exists in database")
+        print(f"Successfully seeded {inserted} records from {os.path.basename(csv_file_path)}.")
+    else:
+        db.rollback()
+        print(f"No valid records to insert from {os.path.basename(csv_file_path)}.")
+
+def _iter_clean_rows(reader, existing_ids: set, file_name: str):
+    """
+    Yields cleaned rows from a csv.reader as tuples ordered like COPY_COLUMNS.
+    SKIPS rows ONLY if event_id is missing/empty, duplicated or invalid.
     For all other fields (including empty event_timestamp), stores the row as is.
     event_id is read from the CSV file.
     """
-    valid_records = []
+    # Resolve column positions once from the header instead of building a dict per row
+    header = next(reader, None) or []
+    missing = [name for name in COPY_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f"{file_name} is missing columns: {', '.join(missing)}")
+    (
+        event_id_col, merchant_id_col, event_timestamp_col, product_col, event_type_col,
+        amount_col, status_col, channel_col, region_col, merchant_tier_col,
+    ) = (header.index(name) for name in COPY_COLUMNS)
+    
+    # strptime format that last matched in this file, tried first on the next row
+    last_format = None
+    
+    for row in reader:
+        # Skip blank lines (DictReader used to do this implicitly)
+        if not row:
+            continue
+        
+        try:
+            # Get event_id and merchant_id from CSV
+            event_id = row[event_id_col].strip()
+            merchant_id = row[merchant_id_col].strip()
+            
+            # SKIP only if event_id is missing or empty
+            if not event_id:
+                print(f"Skipping row: event_id is missing or empty")
+                continue
+            
+            # SKIP if event_id was already seen in this file (duplicate)
+            event_uuid = uuid.UUID(event_id)
+            event_key = event_uuid.bytes
+            if event_key in existing_ids:
+                print(f"Skipping row: event_id {event_id} is duplicated in {file_name}")
+                continue
+            
+            # Convert event_timestamp to ISO 8601 format
+            raw_timestamp = row[event_timestamp_col]
+            iso_timestamp, last_format = _convert_to_iso8601(raw_timestamp, last_format)
+            
+            # Build the row directly - empty strings become None (NULL in COPY)
+            clean_row = (
+                str(event_uuid),
+                merchant_id if MERCHANT_ID_PATTERN.match(merchant_id) else None,
+                iso_timestamp or None,
+                _parse_literal(row[product_col], PRODUCTS, "product"),
+                _parse_optional_str(row[event_type_col]),
+                _parse_amount(row[amount_col]),
+                _parse_literal(row[status_col], STATUSES, "status"),
+                _parse_literal(row[channel_col], CHANNELS, "channel"),
+                _parse_optional_str(row[region_col]),
+                _parse_literal(row[merchant_tier_col], MERCHANT_TIERS, "merchant_tier"),
+            )
 
-    with open(csv_file_path, mode="r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+        except Exception as e:
+            # Log row errors but keep going
+            print(f"Error processing row in {file_name}: {e}")
+            continue
         
-        for row in reader:
-            try:
-                # Get event_id and merchant_id from CSV
-                event_id = row.get("event_id", "").strip()
-                merchant_id = row.get("merchant_id", "").strip()
-                
-                # SKIP only if event_id is missing or empty
-                if not event_id:
-                    print(f"Skipping row: event_id is missing or empty")
-                    continue
-                
-                # SKIP if event_id already exists in the database (duplicate)
-                if db.query(MerchantEvent).filter(MerchantEvent.event_id == event_id).first():
-                    print(f"Skipping row: event_id {event_id} already exists in database")
-                    continue
-                
-                # Convert event_timestamp to ISO 8601 format
-                raw_timestamp = row.get("event_timestamp", "")
-                iso_timestamp = _convert_to_iso8601(raw_timestamp)
-                
-                # Extract all fields - empty strings will be converted to None by Pydantic
-                event_data = MerchantEventCreate(
-                    event_id=event_id,
-                    merchant_id=merchant_id,
-                    event_timestamp=iso_timestamp,
-                    product=row.get("product", ""),
-                    event_type=row.get("event_type", ""),
-                    amount=row.get("amount", ""),
-                    status=row.get("status", ""),
-                    channel=row.get("channel", ""),
-                    region=row.get("region", ""),
-                    merchant_tier=row.get("merchant_tier", "")
-                )
-                
-                # Append the dictionary for SQLAlchemy bulk insert
-                valid_records.append(event_data.model_dump())
-
-            except Exception as e:
-                # Log row errors but keep going
-                print(f"Error processing row in {os.path.basename(csv_file_path)}: {e}")
-                
-        # Execute Bulk Insert for this file
-        if valid_records:
-            db.execute(insert(MerchantEvent), valid_records)
-            db.commit()
-            print(f"Successfully seeded {len(valid_records)} records from {os.path.basename(csv_file_path)}.")
-        else:
-            print(f"No valid records to insert from {os.path.basename(csv_file_path)}.")
+        existing_ids.add(event_key)
+        yield clean_row
+
+class _CsvCopyStream(io.TextIOBase):
+    """
+    Read-only file object that serialises rows to CSV lazily,
+    so COPY consumes the file without materialising it in memory.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._pending = ""
+        self.row_count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pending) + self._buffer.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self.row_count += 1
+
+        data = self._pending + self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+        if size < 0:
+            self._pending = ""
+            return data
+        self._pending = data[size:]
+        return data[:size]